@@ -0,0 +1,102 @@
+import argparse
+import time
+import statistics
+
+from mongo_db_manager import MongoDBManager
+from neo4j_manager import Neo4jManager
+from ldbc_schema import parse_id
+
+MONGO_URI = "mongodb://localhost:27017"
+MONGO_DB = "social_network_document_database"
+
+NEO4J_URI = "bolt://localhost:7687"
+NEO4J_USER = "neo4j"
+NEO4J_PASSWORD = "p4ssw0rd"
+
+REPETITIONS = 20
+
+# -- usage --
+# before the change (data loaded with string ids):
+#   python benchmark.py <person_id> <university_id> --legacy-string-ids --neo4j-database-dir <dir>
+# after the change (data loaded with int64 ids):
+#   python benchmark.py <person_id> <university_id> --neo4j-database-dir <dir>
+# the same MongoDB indexes are created on both databases, so only the type of the keys changes
+
+
+def measure(function, *args):
+    """ run the function REPETITIONS times and return the median and max latency in milliseconds """
+    latencies = []
+    for _ in range(REPETITIONS):
+        start = time.perf_counter()
+        function(*args)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return round(statistics.median(latencies), 2), round(max(latencies), 2)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Index size and query latency of the two databases")
+    parser.add_argument("person_id", nargs="?", default="14")
+    parser.add_argument("university_id", nargs="?", default="2206")
+    parser.add_argument("--legacy-string-ids", action="store_true",
+                        help="send the ids as strings (data loaded before the typed schema)")
+    parser.add_argument("--neo4j-database-dir",
+                        help="Neo4j database directory, used to read the index sizes (e.g. <neo4j home>/data/databases/neo4j)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    arguments = parse_arguments()
+
+    # ids with the type stored in the databases
+    to_id = str if arguments.legacy_string_ids else parse_id
+    person_id = to_id(arguments.person_id)
+    university_id = to_id(arguments.university_id)
+
+    mongo_manager = MongoDBManager(MONGO_URI, MONGO_DB)
+    # no query timeout: the latency of the slow queries is measured instead of the timeout
+    neo4j_manager = Neo4jManager(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD, query_timeout=None)
+
+    try:
+        # ====== INDEX SIZE ======
+        # same secondary indexes on both versions of the data
+        mongo_manager.create_indexes()
+
+        index_sizes = mongo_manager.get_index_sizes()
+        mongo_manager.print_table(index_sizes)
+        print(f"MongoDB total index size: {sum(index['size'] for index in index_sizes)} bytes")
+
+        neo4j_index_sizes = neo4j_manager.get_index_sizes(arguments.neo4j_database_dir)
+        mongo_manager.print_table(neo4j_index_sizes)
+        if arguments.neo4j_database_dir:
+            print(f"Neo4j total index size: {sum(index['size'] for index in neo4j_index_sizes)} bytes")
+
+        # ====== QUERY LATENCY ======
+        benchmarks = {
+            "get_person_locations": (mongo_manager.get_person_locations, person_id),
+            "get_university_colleagues": (mongo_manager.get_university_colleagues, person_id),
+            "get_work_colleagues": (mongo_manager.get_work_colleagues, person_id),
+            "get_university_students": (mongo_manager.get_university_students, university_id),
+            "get_known_people": (neo4j_manager.get_known_people, person_id),
+        }
+
+        # the ids must exist, otherwise the latency of the "not found" path is measured
+        if "error" in mongo_manager.get_person_info(person_id):
+            raise Exception(f"Person with ID {person_id!r} not found: check the ids and --legacy-string-ids")
+
+        students = mongo_manager.get_university_students(university_id)
+        if "error" in students:
+            print(f"Skipping get_most_popular_in_list: {students['error']}")
+        else:
+            benchmarks["get_most_popular_in_list"] = (neo4j_manager.get_most_popular_in_list, students)
+
+        latencies = []
+        for name, (function, *args) in benchmarks.items():
+            median, worst = measure(function, *args)
+            latencies.append({"query": name, "median (ms)": median, "max (ms)": worst})
+
+        mongo_manager.print_table(latencies)
+
+    finally:
+        mongo_manager.close()
+        neo4j_manager.close()
@@ -0,0 +1,123 @@
+from datetime import datetime, timezone
+from bson.int64 import Int64
+
+# -- LDBC column types --
+INT64 = "int64"          # entity ids and foreign keys
+INT32 = "int32"          # small numbers (years, lengths)
+DATE = "date"            # yyyy-mm-dd
+DATETIME = "datetime"    # ISO 8601 timestamp
+
+# Typed schema of the LDBC entities used by the project (composite-merged-fk layout).
+# Columns not listed here are kept as strings.
+LDBC_SCHEMA = {
+    "Person": {
+        "creationDate": DATETIME,
+        "id": INT64,
+        "birthday": DATE,
+        "LocationCityId": INT64,
+    },
+    "Person_knows_Person": {
+        "creationDate": DATETIME,
+        "Person1Id": INT64,
+        "Person2Id": INT64,
+    },
+    "Person_studyAt_University": {
+        "creationDate": DATETIME,
+        "PersonId": INT64,
+        "UniversityId": INT64,
+        "classYear": INT32,
+    },
+    "Person_workAt_Company": {
+        "creationDate": DATETIME,
+        "PersonId": INT64,
+        "CompanyId": INT64,
+        "workFrom": INT32,
+    },
+    "Person_likes_Post": {
+        "creationDate": DATETIME,
+        "PersonId": INT64,
+        "PostId": INT64,
+    },
+    "Post": {
+        "creationDate": DATETIME,
+        "id": INT64,
+        "length": INT32,
+        "CreatorPersonId": INT64,
+        "ContainerForumId": INT64,
+        "LocationCountryId": INT64,
+    },
+    "Post_hasTag_Tag": {
+        "creationDate": DATETIME,
+        "PostId": INT64,
+        "TagId": INT64,
+    },
+    "Tag": {
+        "id": INT64,
+        "TypeTagClassId": INT64,
+    },
+    "Organisation": {
+        "id": INT64,
+        "LocationPlaceId": INT64,
+    },
+    "Place": {
+        "id": INT64,
+        "PartOfPlaceId": INT64,
+    },
+}
+
+# Cypher expressions used by LOAD CSV to cast a column of the current row
+CYPHER_CASTS = {
+    INT64: "toInteger(row.{column})",
+    INT32: "toInteger(row.{column})",
+    DATE: "date(row.{column})",
+    DATETIME: "datetime(row.{column})",
+}
+
+
+def parse_id(value):
+    """ Convert an id coming from the UI (string or number) into the integer stored in the databases """
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        raise ValueError(f"Invalid id '{value}'")
+
+
+def cast_value(value, column_type):
+    """ Cast a raw csv value to the python/BSON type of the column. Empty values become None """
+    if value == "":
+        return None
+
+    if column_type == INT64:
+        return Int64(value)
+    if column_type == INT32:
+        return int(value)
+    if column_type in (DATE, DATETIME):
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed
+
+    return value
+
+
+def cast_record(entity, record):
+    """
+    Cast the typed columns of a csv record of the given entity.
+    Fields with an empty value are dropped from the record.
+    """
+    schema = LDBC_SCHEMA.get(entity, {})
+    result = {}
+    for column, value in record.items():
+        if column in schema:
+            value = cast_value(value, schema[column])
+            if value is None:
+                continue
+        result[column] = value
+
+    return result
+
+
+def cypher_cast(entity, column):
+    """ Cypher expression reading the given column from a LOAD CSV row with the type of the schema """
+    column_type = LDBC_SCHEMA[entity][column]
+    return CYPHER_CASTS[column_type].format(column=column)
@@ -1,8 +1,17 @@
+# cooperative sockets, so that gevent.Timeout can interrupt a stalled database connection
+from gevent import monkey
+monkey.patch_all()
+
 import json
 import eel
 import time
 from mongo_db_manager import MongoDBManager
 from neo4j_manager import Neo4jManager
+from ldbc_schema import parse_id
+from precompute import QUERY_3_KEY, query_5_key, compute_query_3, compute_query_5, serve_precomputed
+from resilience import BackendUnavailableError, DeadlineExceeded, query_deadline
+from mongo_db_manager import mongo_breaker
+from neo4j_manager import neo4j_breaker
 import datetime
 
 # Eel web folder
@@ -15,15 +24,20 @@ NEO4J_URI = "bolt://localhost:7687"
 NEO4J_USER = "neo4j"
 NEO4J_PASSWORD = "p4ssw0rd"
 
+# deadline (seconds) of each query, shared by all its MongoDB and Neo4j calls
+QUERY_DEADLINE = 10
+
 # Query 1: Location Finder
 @eel.expose
+@query_deadline(QUERY_DEADLINE)
 def execute_query_1(person_id):
     """
     Identify the location of the university where a certain person studied and the location of the company where they work.
     """
-    manager = MongoDBManager(MONGO_URI, MONGO_DB)
+    manager = None
     try:
-        result = manager.get_person_locations(person_id)
+        manager = MongoDBManager(MONGO_URI, MONGO_DB)
+        result = manager.get_person_locations(parse_id(person_id))
         if "error" in result:
             raise Exception(result["error"])
         else:
@@ -39,22 +53,25 @@ def execute_query_1(person_id):
         }
 
     finally:
-        manager.close()
+        if manager:
+            manager.close()
 
     return result
 
 
 # Query 2: Known Colleagues
 @eel.expose
+@query_deadline(QUERY_DEADLINE)
 def execute_query_2(param1):
     """
     Given a person, identify all other people they know within the company where they work or the university where they study.
     """
-    mongo_manager = MongoDBManager(MONGO_URI, MONGO_DB)
-    neo4j_manager = Neo4jManager(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD)
-
+    mongo_manager = neo4j_manager = None
     try:
-        person_id = str(param1)
+        mongo_manager = MongoDBManager(MONGO_URI, MONGO_DB)
+        neo4j_manager = Neo4jManager(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD)
+
+        person_id = parse_id(param1)
         university_colleagues = mongo_manager.get_university_colleagues(person_id)
         work_colleagues = mongo_manager.get_work_colleagues(person_id)
 
@@ -65,11 +82,25 @@ def execute_query_2(param1):
         if "error" in work_colleagues:
             raise Exception(work_colleagues["error"])
 
+        # retrive the known colleagues, if Neo4j is unavailable return only the MongoDB data (degraded result)
+        degraded_message = None
+        try:
+            university_known = neo4j_manager.get_known_from_list(person_id, university_colleagues) if university_colleagues else []
+            work_known = neo4j_manager.get_known_from_list(person_id, work_colleagues) if work_colleagues else []
+        except (BackendUnavailableError, DeadlineExceeded) as e:
+            print(f"Serving partial result: {e}")
+            degraded_message = f"{e}. Known colleagues are not available."
+            university_known = work_known = None
+
         # If the person did not attend university
         if not university_colleagues:
             university = {"total_colleagues": 0, "university_colleagues": "The person did not attend university."}
+        elif university_known is None:
+            university = {
+                "Total Colleagues": len(university_colleagues),
+                "Known Colleagues": "Not available."
+            }
         else:
-            university_known = neo4j_manager.get_known_from_list(person_id, university_colleagues)
             if not university_known:
                 university_known = "The person not known any colleague in the university."
             university = {
@@ -81,8 +112,12 @@ def execute_query_2(param1):
         # if the person doen't work
         if not work_colleagues:
             work = {"Total Colleagues": 0, "Known Colleagues": "The person does not work."}
+        elif work_known is None:
+            work = {
+                "Total Colleagues": len(work_colleagues),
+                "Known Colleagues": "Not available."
+            }
         else:
-            work_known = neo4j_manager.get_known_from_list(person_id, work_colleagues)
             if not work_known:
                 work_known = "The person not known any colleague in the company."
             work = {
@@ -98,31 +133,36 @@ def execute_query_2(param1):
                     "Company": work
                 }
         }
+        if degraded_message:
+            result["degraded"] = True
+            result["message"] = degraded_message
     except Exception as e:
         result = {
             "state": "error",
             "result": f"Error executing query: {e}"
         }
     finally:
-        mongo_manager.close()
-        neo4j_manager.close()
+        if mongo_manager:
+            mongo_manager.close()
+        if neo4j_manager:
+            neo4j_manager.close()
 
     return result
 
 
 # Query 3: Most Likes
 @eel.expose
+@query_deadline(QUERY_DEADLINE)
 def execute_query_3():
     """
     Find the most popular person in terms of total likes across all their posts.
     """
-    manager = Neo4jManager(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD)
+    mongo_manager = manager = None
     try:
-        top_creator = manager.get_most_liked_person()
-        result = {
-            "state": "success",
-            "result": top_creator
-        }
+        mongo_manager = MongoDBManager(MONGO_URI, MONGO_DB)
+        manager = Neo4jManager(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD)
+        # serve the precomputed result if it is current
+        result = serve_precomputed(mongo_manager, manager, QUERY_3_KEY, lambda: compute_query_3(manager))
 
     except Exception as e:
         print(f"Error executing query: {e}")
@@ -132,19 +172,24 @@ def execute_query_3():
         }
 
     finally:
-        manager.close()
+        if mongo_manager:
+            mongo_manager.close()
+        if manager:
+            manager.close()
 
     return result
 
 
 # Query 4: Top Tag
 @eel.expose
+@query_deadline(QUERY_DEADLINE)
 def execute_query_4(param1, param2):
     """
     Find the tag with the most usage during a given time period.
     """
-    manager = Neo4jManager(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD)
+    manager = None
     try:
+        manager = Neo4jManager(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD)
         begin_date_elements = param1.split('-')
         end_date_elements = param2.split('-')
 
@@ -173,52 +218,28 @@ def execute_query_4(param1, param2):
         }
 
     finally:
-        manager.close()
+        if manager:
+            manager.close()
 
     return result
 
 # Query 5: Most Influent Person
 @eel.expose
+@query_deadline(QUERY_DEADLINE)
 def execute_query_5(param1):
     """
     Identify the most popular user within a university (in terms of people who know them)
     """
-    mongo_manager = MongoDBManager(MONGO_URI, MONGO_DB)
-    neo4j_manager = Neo4jManager(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD)
-
+    mongo_manager = neo4j_manager = None
     try:
-        university_id = str(param1)
-        university_students = mongo_manager.get_university_students(university_id)
+        mongo_manager = MongoDBManager(MONGO_URI, MONGO_DB)
+        neo4j_manager = Neo4jManager(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD)
 
-        # errors in colleagues retrive (es. the person does not exists)
-        if "error" in university_students:
-            raise Exception(university_students["error"])
+        university_id = parse_id(param1)
 
-
-        # If the university has no students
-        if not university_students:
-            result = {
-                "state": "success",
-                "result": {
-                    "message": "The university has no students registered in the database."
-                }
-            }
-
-        most_known = neo4j_manager.get_most_popular_in_list(university_students)
-        most_known_person_id = most_known["KnownPersonId"]
-        known_count = most_known["KnownCount"]
-
-        most_known_person = mongo_manager.get_person_info(most_known_person_id)
-
-
-        result = {
-            "state": "success",
-            "result": {
-                "Person": most_known_person,
-                "KnownCount": known_count,
-                "TotalStudents": len(university_students)
-            }
-        }
+        # serve the precomputed result if it is current
+        result = serve_precomputed(mongo_manager, neo4j_manager, query_5_key(university_id),
+                                   lambda: compute_query_5(mongo_manager, neo4j_manager, university_id))
 
     except Exception as e:
         result = {
@@ -226,13 +247,27 @@ def execute_query_5(param1):
             "result": f"Error executing query: {e}"
         }
     finally:
-        mongo_manager.close()
-        neo4j_manager.close()
+        if mongo_manager:
+            mongo_manager.close()
+        if neo4j_manager:
+            neo4j_manager.close()
 
     return result
 
 
 
+# Backend status
+@eel.expose
+def get_backend_status():
+    """
+    State of the circuit breaker and latency/error counters of each database.
+    """
+    return {
+        "MongoDB": mongo_breaker.get_stats(),
+        "Neo4j": neo4j_breaker.get_stats()
+    }
+
+
 # start the application
 if __name__ == '__main__':
     eel.start('index.html', size=(1400, 900))
\ No newline at end of file
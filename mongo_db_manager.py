@@ -1,15 +1,40 @@
 from pymongo import MongoClient, ASCENDING
-from pymongo.errors import OperationFailure
-import sys
-from datetime import datetime
+from pymongo.errors import OperationFailure, PyMongoError, ConnectionFailure, ExecutionTimeout
+from datetime import datetime, timezone
 import pandas as pd
 import os
 
 from tabulate import tabulate
 
+from ldbc_schema import cast_record
+from resilience import CircuitBreaker
+
+# -- timeouts --
+# the deadline of the queries is set by resilience.query_deadline (pymongo.timeout)
+SERVER_SELECTION_TIMEOUT_MS = 2000  # fail fast if the server is down
+
+def is_unavailable(error):
+    """ the error means that MongoDB is down or too slow (server selection, network, timeouts) """
+    if isinstance(error, (ConnectionFailure, ExecutionTimeout)):
+        return True
+    return isinstance(error, PyMongoError) and error.timeout
+
+# circuit breaker shared by all the managers of the process
+mongo_breaker = CircuitBreaker("MongoDB", is_unavailable)
+
 MONGO_URI = "mongodb://localhost:27017"
 MONGO_DB = "social_network_document_database"
 
+# collections read by the queries, loaded in cache by warm_up
+# (precomputed_results is left out: the post-load job rewrites it right after the warm-up)
+HOT_COLLECTIONS = ["Person", "Place", "Organisation", "Person_studyAt_University", "Person_workAt_Company"]
+
+def format_date(value):
+    """ date as yyyy-mm-dd: BSON date, or string for the data loaded before the typed schema """
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d")
+    return value
+
 # -- shell comand to start mongod --
 # mongod --dbpath /Volumes/ZX20/NoSQL_Project/data --logpath /Volumes/ZX20/NoSQL_Project/log/logmongodb.log --fork
 
@@ -19,31 +44,119 @@ class MongoDBManager:
     def __init__(self, connection_string = "mongodb://localhost:27017/", db_name = "social_network_document_database"):
         """ Initializes database connection """
         try:
-            self.client = MongoClient(connection_string)
+            self.client = MongoClient(connection_string, serverSelectionTimeoutMS=SERVER_SELECTION_TIMEOUT_MS,
+                                      connectTimeoutMS=SERVER_SELECTION_TIMEOUT_MS)
             self.db = self.client[db_name]
             print(f"Connected to database '{db_name}'")
         except Exception as e:
+            # the error is raised to the caller: a connection problem must not stop the application
             print(f"Connection error: {e}")
-            sys.exit(1)
+            raise
 
 
     def load_data(self, file_path):
         """Loads data from CSV file into MongoDB"""
 
         collection_name = os.path.splitext(os.path.basename(file_path))[0]
-        df = pd.read_csv(file_path, keep_default_na=False, sep="|")
-
-        # cast the id values into to string
-        for column in df.columns:
-            if "id" in column.lower():
-                df[column] = df[column].astype(str)
+        df = pd.read_csv(file_path, keep_default_na=False, sep="|", dtype=str)
 
-        data = df.to_dict("records")
+        # cast the columns with the types of the LDBC schema (int64 ids, BSON dates)
+        data = [cast_record(collection_name, record) for record in df.to_dict("records")]
 
         self.db[collection_name].insert_many(data)
         print(f"Inserted {len(data)} documents in collection '{collection_name}'")
 
+        # indexes used by the queries (already existing indexes are left unchanged)
+        self.create_indexes()
+
+        # new data: the precomputed results are no longer valid
+        self.set_data_version("MongoDB")
+
+
+    def create_indexes(self):
+        """ Create the indexes on the fields used by the queries """
+        self.db['Person'].create_index([("id", ASCENDING)])
+        self.db['Place'].create_index([("id", ASCENDING)])
+        self.db['Organisation'].create_index([("id", ASCENDING), ("type", ASCENDING)])
+        self.db['Person_studyAt_University'].create_index([("PersonId", ASCENDING)])
+        self.db['Person_studyAt_University'].create_index([("UniversityId", ASCENDING)])
+        self.db['Person_workAt_Company'].create_index([("PersonId", ASCENDING), ("workFrom", ASCENDING)])
+        self.db['Person_workAt_Company'].create_index([("CompanyId", ASCENDING)])
+        print("Indexes created.")
+
+
+    def get_index_sizes(self):
+        """ get the size in bytes of every index of every collection """
+        result = []
+        for collection_name in self.db.list_collection_names():
+            stats = self.db.command("collStats", collection_name)
+            for index_name, size in stats["indexSizes"].items():
+                result.append({"collection": collection_name, "index": index_name, "size": size})
+
+        return result
+
+
+    @mongo_breaker.protect
+    def get_data_version(self):
+        """
+        get the version of the data of both databases: a precomputed result is current only if neither
+        database was reloaded after its computation. None if one of the databases was never loaded.
+        The versions are kept in MongoDB, so serving a precomputed result does not need Neo4j.
+        """
+        metadata = self.db['metadata'].find_one({"_id": "data_version"})
+        if not metadata or "MongoDB" not in metadata or "Neo4j" not in metadata:
+            return None
+
+        return f"{metadata['MongoDB']}|{metadata['Neo4j']}"
 
+
+    def set_data_version(self, database):
+        """ stamp the data of a database ("MongoDB" or "Neo4j") with a new version after a reload """
+        version = datetime.now(timezone.utc).isoformat()
+        self.db['metadata'].update_one({"_id": "data_version"}, {"$set": {database: version}}, upsert=True)
+        return version
+
+
+    @mongo_breaker.protect
+    def get_precomputed_result(self, key, data_version):
+        """ get a precomputed result if it was computed on the given data version (None otherwise) """
+        if data_version is None:
+            return None
+
+        return self.db['precomputed_results'].find_one({"_id": key, "dataVersion": data_version})
+
+
+    @mongo_breaker.protect
+    def get_latest_precomputed_result(self, key):
+        """ get a precomputed result whatever its data version (None if it was never computed) """
+        return self.db['precomputed_results'].find_one({"_id": key})
+
+
+    def save_precomputed_result(self, key, result, data_version):
+        """ save (or replace) a precomputed result stamped with the data version """
+        self.db['precomputed_results'].replace_one(
+            {"_id": key},
+            {"result": result, "dataVersion": data_version, "computedAt": datetime.now(timezone.utc)},
+            upsert=True
+        )
+
+
+    def warm_up(self):
+        """ Load the indexes and the documents of the hot collections in the WiredTiger cache """
+        for collection_name in HOT_COLLECTIONS:
+            collection = self.db[collection_name]
+
+            # index scan of every index
+            for index in collection.list_indexes():
+                collection.count_documents({}, hint=index["name"])
+
+            # collection scan to read every document
+            collection.count_documents({}, hint=[("$natural", ASCENDING)])
+
+        print("MongoDB cache warmed up.")
+
+
+    @mongo_breaker.protect
     def get_person_info(self, person_id):
         """ get info about a person: firstName, lastName, gender, locationCity, birthday """
 
@@ -58,7 +171,7 @@ class MongoDBManager:
             "firstName": person["firstName"],
             "lastName": person["lastName"],
             "gender": person["gender"],
-            "birthday": person["birthday"],
+            "birthday": format_date(person.get("birthday", "")),
             "locationCity": locationCity["name"] if locationCity else ""
         }
 
@@ -66,6 +179,7 @@ class MongoDBManager:
         return person_info
 
 
+    @mongo_breaker.protect
     def get_person_locations(self, person_id):
         """
         Find university and company locations for a person.
@@ -77,8 +191,6 @@ class MongoDBManager:
 
         result = {"University": [], "Company": []}
 
-        person_id = str(person_id)
-
         # retrive the university in relation to the person
         study_relations = list(self.db['Person_studyAt_University'].find(
             {"PersonId": person_id},
@@ -155,6 +267,13 @@ class MongoDBManager:
 
         return result
 
+    @mongo_breaker.protect
+    def get_university_ids(self):
+        """ get the ids of all the universities """
+        universities = self.db['Organisation'].find({"type": "University"}, {"_id": 0, "id": 1})
+        return [university["id"] for university in universities]
+
+    @mongo_breaker.protect
     def get_university_students(self, university_id, exclude_id = None):
         """
         get all students of a university exelcluding the person with id = exclude_id
@@ -164,7 +283,7 @@ class MongoDBManager:
         if not self.db['Organisation'].find_one({"id": university_id, "type": "University"}, {"_id": 1}):
             return {"error": f"University with ID {university_id} not found"}
 
-        if exclude_id:
+        if exclude_id is not None:
             studyAt_relations = self.db['Person_studyAt_University'].find({"UniversityId": university_id, "PersonId": {"$ne": exclude_id}}, {"PersonId": 1})
         else:
             studyAt_relations = self.db['Person_studyAt_University'].find({"UniversityId": university_id}, {"PersonId": 1})
@@ -173,6 +292,7 @@ class MongoDBManager:
 
         return result
 
+    @mongo_breaker.protect
     def get_university_colleagues(self, person_id):
         """
         get all colleagues of a person in the university where they study
@@ -196,6 +316,7 @@ class MongoDBManager:
 
         return colleagues
 
+    @mongo_breaker.protect
     def get_work_colleagues(self, person_id):
         """
         get all colleagues of a person in the company where they work at the moment (last work)
@@ -237,8 +358,8 @@ if __name__ == "__main__":
 
     # Initialize manager
     manager = MongoDBManager(MONGO_URI, MONGO_DB)
-    person_id = "14"
-    university_id = "2206"
+    person_id = 14
+    university_id = 2206
 
     #manager.load_data("/Volumes/ZX20/NoSQL_Project/ldbc_data/ldbc_output/graphs/csv/interactive/composite-merged-fk/static/Organisation.csv")
     result = manager.get_university_students(university_id)
@@ -1,16 +1,75 @@
 from dns.e164 import query
 from future.backports.datetime import tzinfo
-from neo4j import GraphDatabase
+import contextlib
+import gevent
+from neo4j import GraphDatabase, Query
+from neo4j.exceptions import Neo4jError, ServiceUnavailable, SessionExpired, TransientError
 import logging
 import datetime
+import glob
+import os
+
+from ldbc_schema import cypher_cast
+from resilience import CircuitBreaker, remaining_time
+
+# -- timeouts (seconds) --
+CONNECTION_TIMEOUT = 2    # fail fast if the server is down
+QUERY_TIMEOUT = 5         # transaction timeout of the read queries run without a query deadline
+                          # (None for offline jobs: no timeout)
+
+class Neo4jClientTimeout(Exception):
+    """ Raised on the client side when Neo4j does not answer a read query within its timeout """
+
+
+def is_unavailable(error):
+    """ the error means that Neo4j is down or too slow (connection lost, transient errors, timeouts) """
+    if isinstance(error, (ServiceUnavailable, SessionExpired, TransientError, Neo4jClientTimeout)):
+        return True
+    # Neo.ClientError.Transaction.TransactionTimedOut(ClientConfiguration)
+    return isinstance(error, Neo4jError) and "TransactionTimedOut" in (error.code or "")
+
+# circuit breaker shared by all the managers of the process
+neo4j_breaker = CircuitBreaker("Neo4j", is_unavailable)
+
+# queries reading the indexes, nodes and relationships used by the application, run by warm_up
+WARM_UP_QUERIES = [
+    "MATCH (p:Person) WHERE p.id IS NOT NULL RETURN count(p)",
+    "MATCH (p:Post) WHERE p.id IS NOT NULL RETURN count(p)",
+    "MATCH (t:Tag) WHERE t.id IS NOT NULL RETURN count(t.name)",
+    "MATCH (p:Person)-[:KNOWS]->(known:Person) RETURN count(known.id)",
+    "MATCH (:Person)-[r:CREATED]->(:Post)<-[like:LIKES]-(:Person) RETURN count(r.creationDate)",
+    "MATCH (:Post)-[r:HASTAG]->(:Tag) RETURN count(r.creationDate)",
+]
 
 
 class Neo4jManager:
-    def __init__(self, uri, user, password):
+    def __init__(self, uri, user, password, query_timeout=QUERY_TIMEOUT):
         """
         Initializes the Neo4j driver and start connection
         """
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+        self.driver = GraphDatabase.driver(uri, auth=(user, password),
+                                           connection_timeout=CONNECTION_TIMEOUT,
+                                           connection_acquisition_timeout=CONNECTION_TIMEOUT)
+        self.query_timeout = query_timeout
+
+    def read_query(self, text):
+        """
+        Wraps a read query with the transaction timeout (the time left before the query deadline).
+        Without a query deadline and with query_timeout None the query has no timeout.
+        """
+        return Query(text, timeout=remaining_time(self.query_timeout))
+
+    @contextlib.contextmanager
+    def read_session(self):
+        """
+        Session for the read queries, interrupted on the client side (gevent.Timeout) when the time left
+        before the query deadline is elapsed: the transaction timeout is enforced by the server only,
+        a stalled connection would block session.run forever.
+        """
+        timeout = remaining_time(self.query_timeout)
+        with gevent.Timeout(timeout, Neo4jClientTimeout("no answer from Neo4j within the query timeout")):
+            with self.driver.session() as session:
+                yield session
 
     def close(self):
         """
@@ -28,9 +87,9 @@ class Neo4jManager:
 
     def load_people(self, csv_file):
         """Loads Person nodes from LDBC csv file."""
-        query = """
+        query = f"""
         LOAD CSV WITH HEADERS FROM 'file:///' + $file AS row FIELDTERMINATOR '|'
-        MERGE (p:Person {id: row.id})
+        MERGE (p:Person {{id: {cypher_cast("Person", "id")}}})
         SET p.firstName = row.firstName,
             p.lastName = row.lastName
         """
@@ -40,12 +99,12 @@ class Neo4jManager:
 
     def load_posts(self, csv_file):
         """Loads Post nodes and creates [:CREATED] relation to Person."""
-        query = """
+        query = f"""
         LOAD CSV WITH HEADERS FROM 'file:///' + $file AS row FIELDTERMINATOR '|'
-        MERGE (post:Post {id: row.id})
+        MERGE (post:Post {{id: {cypher_cast("Post", "id")}}})
         WITH post, row
-        MATCH (creator:Person {id: row.CreatorPersonId})
-        MERGE (creator)-[:CREATED {creationDate : datetime(row.creationDate)}]->(post)
+        MATCH (creator:Person {{id: {cypher_cast("Post", "CreatorPersonId")}}})
+        MERGE (creator)-[:CREATED {{creationDate : {cypher_cast("Post", "creationDate")}}}]->(post)
         """
         with self.driver.session() as session:
             session.run(query, file=csv_file)
@@ -53,10 +112,10 @@ class Neo4jManager:
 
     def load_likes_edges(self, csv_file):
         """Loads 'LIKES' relationships between Person and Post nodes."""
-        query = """
+        query = f"""
         LOAD CSV WITH HEADERS FROM 'file:///' + $file AS row FIELDTERMINATOR '|'
-        MATCH (per:Person {id: row.PersonId})
-        MATCH (pos:Post {id: row.PostId})
+        MATCH (per:Person {{id: {cypher_cast("Person_likes_Post", "PersonId")}}})
+        MATCH (pos:Post {{id: {cypher_cast("Person_likes_Post", "PostId")}}})
         MERGE (per)-[:LIKES]->(pos)
         """
         with self.driver.session() as session:
@@ -65,13 +124,13 @@ class Neo4jManager:
 
     def load_tags_edges(self, csv_file):
         """Loads Tag noted and create 'HASTAG' relationships between Post and Tag."""
-        query = """
+        query = f"""
         LOAD CSV WITH HEADERS FROM 'file:///' + $file AS row FIELDTERMINATOR '|'
         
-        MERGE (tag:Tag {id: row.TagId})
+        MERGE (tag:Tag {{id: {cypher_cast("Post_hasTag_Tag", "TagId")}}})
         WITH tag, row
-        MATCH (post:Post {id: row.PostId})
-        MERGE (post)-[:HASTAG {creationDate : datetime(row.creationDate)}]->(tag)
+        MATCH (post:Post {{id: {cypher_cast("Post_hasTag_Tag", "PostId")}}})
+        MERGE (post)-[:HASTAG {{creationDate : {cypher_cast("Post_hasTag_Tag", "creationDate")}}}]->(tag)
         """
         with self.driver.session() as session:
             session.run(query, file=csv_file)
@@ -79,9 +138,9 @@ class Neo4jManager:
 
     def load_tags_info(self, csv_file):
         """ Set the name to TAGS nodes"""
-        query = """
+        query = f"""
         LOAD CSV WITH HEADERS FROM 'file:///' + $file AS row FIELDTERMINATOR '|'
-        MATCH (tag:Tag {id: row.id})
+        MATCH (tag:Tag {{id: {cypher_cast("Tag", "id")}}})
         SET tag.name = row.name
         """
         with self.driver.session() as session:
@@ -90,16 +149,17 @@ class Neo4jManager:
 
     def load_knows_edges(self, csv_file):
         """Loads 'KNOWS' relationships between people."""
-        query = """
+        query = f"""
         LOAD CSV WITH HEADERS FROM 'file:///' + $file AS row FIELDTERMINATOR '|'
-        MATCH (p1:Person {id: row.Person1Id})
-        MATCH (p2:Person {id: row.Person2Id})
+        MATCH (p1:Person {{id: {cypher_cast("Person_knows_Person", "Person1Id")}}})
+        MATCH (p2:Person {{id: {cypher_cast("Person_knows_Person", "Person2Id")}}})
         MERGE (p1)-[:KNOWS]->(p2)
         """
         with self.driver.session() as session:
             session.run(query, file=csv_file)
             print(f"KNOWS edges loaded")
 
+    @neo4j_breaker.protect
     def get_most_liked_person(self):
         """Returns the person with the most likes (across all posts)."""
         query = """
@@ -110,14 +170,15 @@ class Neo4jManager:
         ORDER BY TotalLikes DESC
         LIMIT 1
         """
-        with self.driver.session() as session:
-            result = session.run(query)
+        with self.read_session() as session:
+            result = session.run(self.read_query(query))
             record = result.single()
             if record:
                 return record.data()
 
             return None
 
+    @neo4j_breaker.protect
     def get_most_used_tag(self, begin_date, end_date):
         """Returns the tag with the most usages (posts) during a given time period."""
         query = """
@@ -128,10 +189,11 @@ class Neo4jManager:
         ORDER BY TotalUsages DESC
         LIMIT 5
         """
-        with self.driver.session() as session:
-            result = session.run(query, begin_date=begin_date, end_date=end_date)
+        with self.read_session() as session:
+            result = session.run(self.read_query(query), begin_date=begin_date, end_date=end_date)
             return [record.data() for record in result]
 
+    @neo4j_breaker.protect
     def get_known_from_list(self, person_id, id_list):
         """Returns the people that the given person knows from the given list."""
         query = """
@@ -139,10 +201,11 @@ class Neo4jManager:
             WHERE known.id IN $id_list
             RETURN known.id AS KnownPersonId, known.firstName AS KnownFirstName, known.lastName AS KnownLastName
         """
-        with self.driver.session() as session:
-            result = session.run(query, person_id=person_id, id_list=id_list)
+        with self.read_session() as session:
+            result = session.run(self.read_query(query), person_id=person_id, id_list=id_list)
             return [f"{record.data()["KnownFirstName"]} {record.data()["KnownLastName"]} ({record.data()["KnownPersonId"]})" for record in result]
 
+    @neo4j_breaker.protect
     def get_most_popular_in_list(self, person_ids):
         """ get the most known person from a list of people """
         query = """
@@ -152,14 +215,15 @@ class Neo4jManager:
             ORDER BY KnownCount DESC
             LIMIT 1
         """
-        with self.driver.session() as session:
-            result = session.run(query, person_ids=person_ids)
+        with self.read_session() as session:
+            result = session.run(self.read_query(query), person_ids=person_ids)
             record = result.single()
             if record:
                 return record.data()
 
             return None
 
+    @neo4j_breaker.protect
     def get_known_people(self, person_id):
         """Returns all the people that the given person knows."""
         query = """
@@ -167,13 +231,50 @@ class Neo4jManager:
             WHERE person.id = $person_id
             RETURN known.id AS KnownPersonId
         """
-        with self.driver.session() as session:
-            result = session.run(query, person_id=person_id)
+        with self.read_session() as session:
+            result = session.run(self.read_query(query), person_id=person_id)
             return [record.data()["KnownPersonId"] for record in result]
 
 
-    def load_data(self):
-        """wrapper for all the load functions to load the data in the database."""
+    def warm_up(self):
+        """ Load the indexes, nodes and relationships used by the queries in the page cache """
+        with self.driver.session() as session:
+            for query in WARM_UP_QUERIES:
+                session.run(query).consume()
+            print("Neo4j page cache warmed up.")
+
+    def get_index_sizes(self, database_dir=None):
+        """
+        get the indexes and their size in bytes on disk.
+        The size is read from the index files in database_dir (e.g. <neo4j home>/data/databases/neo4j),
+        it is None if the directory is not given.
+        """
+        query = """
+            SHOW INDEXES YIELD id, name, type, labelsOrTypes, properties
+            RETURN id, name, type, labelsOrTypes, properties
+        """
+        with self.driver.session() as session:
+            indexes = [record.data() for record in session.run(query)]
+
+        result = []
+        for index in indexes:
+            size = None
+            if database_dir:
+                # the files of an index are in schema/index/<provider>/<index id>/
+                size = 0
+                for index_dir in glob.glob(os.path.join(database_dir, "schema", "index", "*", str(index["id"]))):
+                    for root, _, files in os.walk(index_dir):
+                        size += sum(os.path.getsize(os.path.join(root, file)) for file in files)
+
+            result.append({"index": index["name"], "type": index["type"], "size": size})
+
+        return result
+
+    def load_data(self, mongo_manager):
+        """
+        wrapper for all the load functions to load the data in the database.
+        The new data version is recorded in MongoDB (mongo_manager), where the precomputed results are stored.
+        """
         self.clear_database()
 
         self.load_people(
@@ -196,6 +297,9 @@ class Neo4jManager:
             session.run("CREATE INDEX tag_id IF NOT EXISTS FOR (t:Tag) ON (t.id)")
             print("Index created.")
 
+        # new data: the precomputed results are no longer valid
+        mongo_manager.set_data_version("Neo4j")
+
 
 
 if __name__ == "__main__":
@@ -209,7 +313,8 @@ if __name__ == "__main__":
 
 
         # ====== DATA LOADING ======
-        # db.load_data()
+        # the new data version is recorded in MongoDB (from mongo_db_manager import MongoDBManager)
+        # db.load_data(MongoDBManager())
         pass
 
     finally:
@@ -0,0 +1,129 @@
+from mongo_db_manager import MongoDBManager, mongo_breaker
+from neo4j_manager import Neo4jManager
+from resilience import BackendUnavailableError, DeadlineExceeded, reserve_time
+
+MONGO_URI = "mongodb://localhost:27017"
+MONGO_DB = "social_network_document_database"
+
+NEO4J_URI = "bolt://localhost:7687"
+NEO4J_USER = "neo4j"
+NEO4J_PASSWORD = "p4ssw0rd"
+
+# keys of the documents in the precomputed_results collection
+QUERY_3_KEY = "query_3"
+
+# seconds of the query deadline kept to serve the degraded answer when a database is slow
+FALLBACK_TIME = 1
+
+# -- post-load job --
+# run after loading the data in both databases:
+# python precompute.py
+
+
+def query_5_key(university_id):
+    """ key of the precomputed result of Query 5 for a university """
+    return f"query_5:{university_id}"
+
+
+def compute_query_3(neo4j_manager):
+    """ Query 3: the most popular person in terms of total likes across all their posts """
+    return neo4j_manager.get_most_liked_person()
+
+
+def compute_query_5(mongo_manager, neo4j_manager, university_id):
+    """ Query 5: the most popular student of a university (in terms of people who know them) """
+    university_students = mongo_manager.get_university_students(university_id)
+
+    # errors in students retrive (es. the university does not exists)
+    if "error" in university_students:
+        raise Exception(university_students["error"])
+
+    # If the university has no students
+    if not university_students:
+        return {"message": "The university has no students registered in the database."}
+
+    most_known = neo4j_manager.get_most_popular_in_list(university_students)
+
+    # If nobody knows the students of the university
+    if not most_known:
+        return {"message": "No student of the university is known by other people."}
+
+    most_known_person = mongo_manager.get_person_info(most_known["KnownPersonId"])
+
+    return {
+        "Person": most_known_person,
+        "KnownCount": most_known["KnownCount"],
+        "TotalStudents": len(university_students)
+    }
+
+
+def serve_precomputed(mongo_manager, neo4j_manager, key, compute):
+    """
+    Serve the precomputed result of a query if it is current, compute it otherwise.
+    If MongoDB is unavailable the result is computed without the precomputed results,
+    if Neo4j is unavailable the last precomputed result is served. Both are flagged as degraded.
+    """
+    try:
+        with reserve_time(FALLBACK_TIME):
+            data_version = mongo_manager.get_data_version()
+            precomputed = mongo_manager.get_precomputed_result(key, data_version)
+            result = precomputed["result"] if precomputed else compute()
+        return {
+            "state": "success",
+            "result": result
+        }
+
+    except (BackendUnavailableError, DeadlineExceeded) as e:
+        # the precomputed results are stored in MongoDB: compute the result on the fly
+        if isinstance(e, BackendUnavailableError) and e.backend == mongo_breaker.backend:
+            print(f"Computing '{key}' without the precomputed results: {e}")
+            return {
+                "state": "success",
+                "degraded": True,
+                "message": f"{e}. The result was computed without the precomputed results.",
+                "result": compute()
+            }
+
+        stale = mongo_manager.get_latest_precomputed_result(key)
+        if not stale:
+            raise
+
+        print(f"Serving stale result for '{key}': {e}")
+        return {
+            "state": "success",
+            "degraded": True,
+            "message": f"{e}. Showing the result computed at {stale['computedAt']:%Y-%m-%d %H:%M}, it may be outdated.",
+            "result": stale["result"]
+        }
+
+
+def precompute_results(mongo_manager, neo4j_manager):
+    """ Compute Query 3 and Query 5 (for every university) and save them stamped with the data version """
+    data_version = mongo_manager.get_data_version()
+    if data_version is None:
+        print("No data version found: load the data in both databases before precomputing the results.")
+        return
+
+    mongo_manager.save_precomputed_result(QUERY_3_KEY, compute_query_3(neo4j_manager), data_version)
+
+    university_ids = mongo_manager.get_university_ids()
+    for university_id in university_ids:
+        result = compute_query_5(mongo_manager, neo4j_manager, university_id)
+        mongo_manager.save_precomputed_result(query_5_key(university_id), result, data_version)
+
+    print(f"Precomputed Query 3 and Query 5 for {len(university_ids)} universities (data version {data_version})")
+
+
+if __name__ == "__main__":
+    mongo_manager = MongoDBManager(MONGO_URI, MONGO_DB)
+    # offline job: the full-graph aggregations must not be stopped by the query timeout
+    neo4j_manager = Neo4jManager(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD, query_timeout=None)
+
+    try:
+        mongo_manager.warm_up()
+        neo4j_manager.warm_up()
+        precompute_results(mongo_manager, neo4j_manager)
+
+    finally:
+        mongo_manager.close()
+        neo4j_manager.close()
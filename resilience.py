@@ -0,0 +1,205 @@
+import contextlib
+import contextvars
+import functools
+import threading
+import time
+
+import pymongo
+
+# -- circuit breaker defaults --
+FAILURE_THRESHOLD = 3   # consecutive failures before opening the circuit
+RESET_TIMEOUT = 30      # seconds before letting a trial call through an open circuit
+
+# a database call is not started with less than MIN_CALL_TIME seconds left before the query deadline:
+# it would time out because of the time used by the previous calls, not because the database is slow
+MIN_CALL_TIME = 0.2
+
+
+# expiration (time.monotonic) of the deadline of the current query
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+@contextlib.contextmanager
+def query_deadline(seconds):
+    """
+    One deadline for all the database calls of a query: the MongoDB operations run with
+    pymongo.timeout, the Neo4j transactions with the time left (see remaining_time).
+    """
+    expiration = time.monotonic() + seconds
+    # a nested deadline cannot extend the current one (pymongo.timeout is capped the same way)
+    if _deadline.get() is not None:
+        expiration = min(expiration, _deadline.get())
+
+    token = _deadline.set(expiration)
+    try:
+        with pymongo.timeout(max(expiration - time.monotonic(), 0.001)):
+            yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextlib.contextmanager
+def reserve_time(seconds):
+    """
+    Run the block with the current query deadline shortened by seconds,
+    keeping them for what follows the block (e.g. a degraded answer when the block fails)
+    """
+    expiration = _deadline.get()
+    if expiration is None:
+        yield
+        return
+
+    with query_deadline(max(expiration - seconds - time.monotonic(), 0.001)):
+        yield
+
+
+def check_deadline():
+    """ raise DeadlineExceeded if there is not enough time left to start a database call """
+    expiration = _deadline.get()
+    if expiration is not None and expiration - time.monotonic() < MIN_CALL_TIME:
+        raise DeadlineExceeded("query deadline exceeded")
+
+
+def remaining_time(default):
+    """ seconds left before the deadline of the current query, default if there is no deadline """
+    expiration = _deadline.get()
+    if expiration is None:
+        return default
+
+    # a timeout of 0 disables the Neo4j transaction timeout, keep at least 1 ms
+    return max(expiration - time.monotonic(), 0.001)
+
+
+class BackendUnavailableError(Exception):
+    """ Raised when a database call fails or its circuit is open """
+
+    def __init__(self, backend, message):
+        super().__init__(f"{backend} unavailable: {message}")
+        self.backend = backend
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when a database call is not started because the query deadline is (almost) over.
+    It is not recorded by the circuit breakers: the time was used by the previous calls of the query.
+    """
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker and latency/error counters for one database.
+
+    closed: calls go through, consecutive failures are counted
+    open: calls fail fast with BackendUnavailableError until reset_timeout is elapsed
+    half-open: one trial call goes through, its outcome closes or reopens the circuit
+
+    Only the errors for which is_failure(error) is true (the database is down or too slow) are failures,
+    any other error (e.g. a bad query) means the database answered.
+    """
+
+    def __init__(self, backend, is_failure, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.backend = backend
+        self.is_failure = is_failure
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.lock = threading.Lock()
+        # > 0 inside a protected call: nested protected calls are counted by the outermost one
+        self.depth = contextvars.ContextVar(f"{backend}_depth", default=0)
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = None
+
+        # counters
+        self.calls = 0
+        self.errors = 0
+        self.rejected = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def reset(self):
+        """ close the circuit and clear the counters """
+        with self.lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self.calls = self.errors = self.rejected = 0
+            self.total_latency = self.max_latency = 0.0
+
+    def before_call(self):
+        """
+        fail fast if the circuit is open or a trial call is running,
+        move to half-open (this call is the trial) when the reset timeout is elapsed
+        """
+        with self.lock:
+            if self.state == "half-open":
+                self.rejected += 1
+                raise BackendUnavailableError(self.backend, "circuit half-open, trial call running")
+
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    raise BackendUnavailableError(self.backend, "circuit open, failing fast")
+                self.state = "half-open"
+
+    def record(self, latency, failed):
+        """ update the counters and the state of the circuit with the outcome of a call """
+        with self.lock:
+            self.calls += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+            if failed:
+                self.errors += 1
+                self.consecutive_failures += 1
+                if self.state == "half-open" or self.consecutive_failures >= self.failure_threshold:
+                    if self.state != "open":
+                        print(f"{self.backend} circuit opened after {self.consecutive_failures} failures")
+                    self.state = "open"
+                    self.opened_at = time.monotonic()
+            else:
+                self.consecutive_failures = 0
+                self.state = "closed"
+
+    def protect(self, method):
+        """ decorator running a database call through the circuit breaker """
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            # nested protected call: counted by the outermost call
+            if self.depth.get() > 0:
+                return method(*args, **kwargs)
+
+            check_deadline()
+            self.before_call()
+
+            token = self.depth.set(1)
+            start = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            except BaseException as e:
+                # every outcome is recorded, so a trial call always leaves the half-open state
+                failed = isinstance(e, Exception) and self.is_failure(e)
+                self.record(time.perf_counter() - start, failed=failed)
+                if failed:
+                    raise BackendUnavailableError(self.backend, e) from e
+                raise
+            finally:
+                self.depth.reset(token)
+
+            self.record(time.perf_counter() - start, failed=False)
+            return result
+
+        return wrapper
+
+    def get_stats(self):
+        """ state of the circuit and latency/error counters """
+        with self.lock:
+            return {
+                "state": self.state,
+                "calls": self.calls,
+                "errors": self.errors,
+                "rejected": self.rejected,
+                "avg_latency_ms": round(self.total_latency / self.calls * 1000, 2) if self.calls else 0,
+                "max_latency_ms": round(self.max_latency * 1000, 2),
+            }
@@ -0,0 +1,124 @@
+import time
+from datetime import datetime
+
+import pytest
+from pymongo.errors import ExecutionTimeout
+
+import precompute
+from precompute import QUERY_3_KEY, query_5_key, compute_query_3, compute_query_5, serve_precomputed
+from mongo_db_manager import mongo_breaker
+from neo4j_manager import neo4j_breaker, Neo4jClientTimeout
+from resilience import FAILURE_THRESHOLD, DeadlineExceeded, query_deadline, remaining_time
+
+QUERY_DEADLINE = 1
+UNIVERSITY_ID = 2206
+
+
+def check_mongo_deadline():
+    """ like pymongo.timeout: a MongoDB operation fails before being sent if the query deadline is over """
+    if remaining_time(None) is not None and remaining_time(None) <= 0.001:
+        raise ExecutionTimeout("operation would exceed time limit")
+
+
+class HealthyMongoDBManager:
+    """ MongoDB answering immediately, the precomputed results are outdated """
+
+    @mongo_breaker.protect
+    def get_data_version(self):
+        check_mongo_deadline()
+        return "new-version"
+
+    @mongo_breaker.protect
+    def get_precomputed_result(self, key, data_version):
+        check_mongo_deadline()
+        return None
+
+    @mongo_breaker.protect
+    def get_latest_precomputed_result(self, key):
+        check_mongo_deadline()
+        return {"result": {"stale": key}, "computedAt": datetime(2026, 1, 1)}
+
+    @mongo_breaker.protect
+    def get_university_students(self, university_id):
+        check_mongo_deadline()
+        return [1, 2, 3]
+
+    @mongo_breaker.protect
+    def get_person_info(self, person_id):
+        check_mongo_deadline()
+        return {"firstName": "Jan", "lastName": "Kowalski"}
+
+
+class SlowNeo4jManager:
+    """ Neo4j with a stalled connection: no answer until the client side timeout """
+
+    def wait(self):
+        time.sleep(remaining_time(None))
+        raise Neo4jClientTimeout("no answer from Neo4j within the query timeout")
+
+    @neo4j_breaker.protect
+    def get_most_liked_person(self):
+        self.wait()
+
+    @neo4j_breaker.protect
+    def get_most_popular_in_list(self, person_ids):
+        self.wait()
+
+
+@pytest.fixture(autouse=True)
+def reset_breakers(monkeypatch):
+    mongo_breaker.reset()
+    neo4j_breaker.reset()
+    monkeypatch.setattr(precompute, "FALLBACK_TIME", 0.5)
+
+
+def run_query_3(mongo_manager, neo4j_manager):
+    with query_deadline(QUERY_DEADLINE):
+        return serve_precomputed(mongo_manager, neo4j_manager, QUERY_3_KEY,
+                                 lambda: compute_query_3(neo4j_manager))
+
+
+def run_query_5(mongo_manager, neo4j_manager):
+    with query_deadline(QUERY_DEADLINE):
+        return serve_precomputed(mongo_manager, neo4j_manager, query_5_key(UNIVERSITY_ID),
+                                 lambda: compute_query_5(mongo_manager, neo4j_manager, UNIVERSITY_ID))
+
+
+def test_slow_neo4j_serves_stale_results():
+    mongo_manager = HealthyMongoDBManager()
+    neo4j_manager = SlowNeo4jManager()
+
+    # enough queries to open the Neo4j circuit: the stale results are still served
+    for _ in range(FAILURE_THRESHOLD + 1):
+        result = run_query_3(mongo_manager, neo4j_manager)
+        assert result["state"] == "success"
+        assert result["degraded"]
+        assert result["result"] == {"stale": QUERY_3_KEY}
+
+        result = run_query_5(mongo_manager, neo4j_manager)
+        assert result["state"] == "success"
+        assert result["degraded"]
+        assert result["result"] == {"stale": query_5_key(UNIVERSITY_ID)}
+
+    assert neo4j_breaker.get_stats()["state"] == "open"
+
+    # the slow Neo4j is not counted against MongoDB
+    mongo_stats = mongo_breaker.get_stats()
+    assert mongo_stats["state"] == "closed"
+    assert mongo_stats["errors"] == 0
+
+
+def test_expired_deadline_is_not_recorded():
+    mongo_manager = HealthyMongoDBManager()
+
+    for _ in range(FAILURE_THRESHOLD + 1):
+        with query_deadline(0.01):
+            with pytest.raises(DeadlineExceeded):
+                mongo_manager.get_data_version()
+
+    mongo_stats = mongo_breaker.get_stats()
+    assert mongo_stats["state"] == "closed"
+    assert mongo_stats["calls"] == 0
+
+    # MongoDB is still served
+    assert mongo_manager.get_data_version() == "new-version"
@@ -62,6 +62,8 @@ document.getElementById('query-form-2').addEventListener('submit', async functio
         else {
             console.log(result.result);
             displayQuery1Results(result.result)
+            if (result.degraded)
+                displayDegradedWarning(result.message)
         }
     } catch (error) {
         console.error('Error executing query:', error);
@@ -84,6 +86,8 @@ document.getElementById('query-form-3').addEventListener('submit', async functio
         else {
             let title = "Most Influent Person"
             displaySingleGenericResult(result.result, title)
+            if (result.degraded)
+                displayDegradedWarning(result.message)
         }
 
     } catch (error) {
@@ -146,6 +150,8 @@ document.getElementById('query-form-5').addEventListener('submit', async functio
         else {
             let title = `Most influential person in University ${param1}`
             displaySingleGenericResult(result.result, title)
+            if (result.degraded)
+                displayDegradedWarning(result.message)
         }
     } catch (error) {
         console.error('Error executing query:', error);
@@ -246,6 +252,12 @@ function displaySingleGenericResult(data, title) {
     }, 100);
 }
 
+// Warn that the result is partial or outdated (a database is unavailable)
+function displayDegradedWarning(message) {
+    const resultsContent = document.getElementById('results-content');
+    resultsContent.insertAdjacentHTML('afterbegin', `<div class="result-card"><h4><i class="fas fa-exclamation-triangle"></i> Partial Result</h4><div class="result-item"><pre style="margin: 0; white-space: pre-wrap;">${message}</pre></div></div>`);
+}
+
 function displayError(error) {
     const resultsContent = document.getElementById('results-content');
     resultsContent.innerHTML = `<div class="result-card"><h4><i class="fas fa-exclamation-triangle"></i> Error</h4><div class="result-item"><pre style="margin: 0; white-space: pre-wrap;">${error}</pre></div></div>`;